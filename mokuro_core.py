@@ -0,0 +1,221 @@
+# Shared extraction core used by process-volume.py and process-parent-dir.py.
+# Keep this file next to whichever script you run: both import it, and
+# having a single copy of the hot loop means optimizations (or a future
+# compiled build of it) only need to be applied once.
+import concurrent.futures
+import io
+import itertools
+import json
+import mmap
+import os
+import re
+
+# orjson parses JSON several times faster than the stdlib module. It is
+# optional: install it with `pip install orjson`, otherwise the stdlib
+# parser is used.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ijson streams just the parts of the document we need instead of building
+# the whole parsed tree, keeping peak memory at one line rather than one
+# file. Also optional: install it with `pip install ijson` (the yajl2_c
+# backend is picked up automatically when present).
+try:
+    import ijson
+    _PARSE_ERRORS = (json.JSONDecodeError, ijson.JSONError)
+except ImportError:
+    ijson = None
+    _PARSE_ERRORS = (json.JSONDecodeError,)
+
+# UTF-8 lead sequences for the Japanese ranges tested by _contains_japanese:
+# \xe3[\x81-\x83] encodes U+3040-U+30FF (kana), and lead bytes \xe4-\xe9
+# cover U+4000-U+9FFF, a superset of the kanji range. Matching bytes is
+# deliberately conservative: false positives just fall through to the real
+# check, but a miss proves the file holds no Japanese at all.
+_JP_BYTES_RE = re.compile(rb'\xe3[\x81-\x83]|[\xe4-\xe9]')
+
+# Lifts each "lines" string array out of the raw bytes so only those few
+# bytes per block are JSON-parsed, instead of the whole document with its
+# boxes and coordinate tables. "lines_coords" is not matched (the closing
+# quote must follow immediately). [^\]]* truncates at a ']' inside the OCR
+# text itself; the resulting parse error makes the worker fall back to a
+# full-document parse. A truncated file can also leave a "lines" key with
+# no complete array after it, which simply doesn't match, so the worker
+# additionally counts key occurrences and only trusts the fast path when
+# every key produced a parsed array; anything short of that goes through
+# the full parser, so the fast path can never drop lines silently.
+_LINES_ARRAY_RE = re.compile(rb'"lines"\s*:\s*(\[[^\]]*\])')
+_LINES_KEY_RE = re.compile(rb'"lines"\s*:')
+
+
+# Matches any Japanese character. Unicode ranges:
+# ぀-ヿ: Hiragana (U+3040-U+309F) and Katakana (U+30A0-U+30FF), which
+#               are adjacent and fold into one range
+# 一-鿿: CJK Unified Ideographs (Kanji)
+# A compiled character class runs the whole per-character scan inside the
+# regex engine's C loop. That is the closest thing these dependency-free
+# scripts have to a compiled extension for the hot check, and it is an
+# order of magnitude faster than iterating codepoints in bytecode (the
+# previous any(... for o in map(ord, text)) approach). Running under PyPy
+# remains a drop-in option for the surrounding pure-Python loops.
+_JP_RE = re.compile(r'[぀-ヿ一-鿿]')
+
+# The per-line check: returns a truthy match object when the string
+# contains Japanese. Bound once so callers and workers share one lookup.
+_contains_japanese = _JP_RE.search
+
+
+def _inode(path):
+    """Sort key for reading files in on-disk order; 0 if the stat fails."""
+    try:
+        return os.stat(path).st_ino
+    except OSError:
+        return 0
+
+
+def extract_japanese_lines(filepath):
+    """
+    Parses one Mokuro JSON file and returns its Japanese lines as
+    UTF-8-encoded, newline-terminated bytes, so callers can writelines()
+    them straight to a binary-mode file.
+
+    Runs in a worker process, so errors are printed as warnings and an
+    empty list is returned rather than letting one bad file stop the run.
+    """
+    japanese_lines = []
+    # Bind the check and the append method locally so the inner loop avoids
+    # global and attribute lookups.
+    contains_japanese = _contains_japanese
+    append = japanese_lines.append
+    try:
+        # Map the file instead of copying it through a read(): the regex
+        # prefilter and the parsers scan the kernel's page cache directly,
+        # so the file's bytes are never duplicated into a Python object.
+        # Zero-length files can't be mapped, so fall back to a plain read
+        # for them (the mapping itself outlives the closed fd).
+        with open(filepath, 'rb', buffering=0) as f:
+            try:
+                raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                raw = f.read()
+
+        try:
+            # Byte-level prefilter: if the raw file contains no Japanese
+            # UTF-8 sequences at all, skip JSON parsing entirely. The C
+            # regex engine scans bytes far faster than any parser
+            # tokenizes them.
+            if _JP_BYTES_RE.search(raw) is None:
+                return japanese_lines
+
+            # Fast path: Mokuro's schema is rigid enough that the "lines"
+            # arrays can be pattern-matched straight out of the raw bytes
+            # and parsed individually, skipping the full-document parse.
+            # Any oddity that defeats the pattern surfaces as a parse (or
+            # type) error on the extracted array, and the file is handed
+            # to the real parsers below instead.
+            try:
+                loads = orjson.loads if orjson is not None else json.loads
+                fast_lines = []
+                matched_arrays = 0
+                for match in _LINES_ARRAY_RE.finditer(raw):
+                    matched_arrays += 1
+                    for line in loads(match.group(1)):
+                        if line.isascii():
+                            continue
+                        if contains_japanese(line):
+                            fast_lines.append((line + '\n').encode('utf-8'))
+            except Exception:
+                pass
+            else:
+                # Only trust the result when every "lines" key produced a
+                # complete, parsed array. In a truncated or corrupt file a
+                # key can sit before an incomplete array that never
+                # matches, so a count mismatch (or no match at all) routes
+                # the file through the full parser below, where real
+                # corruption still raises and prints the usual warning.
+                if matched_arrays and matched_arrays == len(_LINES_KEY_RE.findall(raw)):
+                    japanese_lines.extend(fast_lines)
+                    return japanese_lines
+
+            if ijson is not None:
+                # Stream only blocks[*].lines[*] out of the buffer; the
+                # rest of the document (boxes, coordinates, font sizes) is
+                # never materialized. mmap objects are file-like, so the
+                # mapping is streamed without a copy. Accumulate into a
+                # local list and only commit it once the stream finishes:
+                # if ijson raises mid-file, the partial lines are discarded
+                # and the warning below reports the file, matching what the
+                # non-streaming paths return for the same corrupt input.
+                source = raw if isinstance(raw, mmap.mmap) else io.BytesIO(raw)
+                streamed_lines = []
+                for line in ijson.items(source, 'blocks.item.lines.item'):
+                    if line.isascii():
+                        continue
+                    if contains_japanese(line):
+                        streamed_lines.append((line + '\n').encode('utf-8'))
+                japanese_lines.extend(streamed_lines)
+                return japanese_lines
+
+            if orjson is not None:
+                # orjson accepts any buffer via memoryview, so mapped
+                # files are parsed zero-copy.
+                data = orjson.loads(memoryview(raw))
+            else:
+                # The stdlib parser only takes bytes, so mapped files pay
+                # one copy here.
+                data = json.loads(raw if isinstance(raw, bytes) else raw[:])
+
+            # The text is in data['blocks'][...]['lines']; flatten the
+            # blocks/lines nesting in C with chain.from_iterable so the hot
+            # loop is a single level deep.
+            blocks = data.get('blocks') or ()
+            for line in itertools.chain.from_iterable(
+                    block.get('lines') or () for block in blocks):
+                # Pure-ASCII lines (page numbers, OCR noise) can't contain
+                # Japanese; str.isascii is a single C-level pass, so skip
+                # them cheaply.
+                if line.isascii():
+                    continue
+                # Add the line only if it contains Japanese text.
+                if contains_japanese(line):
+                    # Encode here, in the worker: each line is encoded
+                    # exactly once, in parallel, instead of per write
+                    # through a TextIOWrapper's incremental encoder.
+                    append((line + '\n').encode('utf-8'))
+        finally:
+            if isinstance(raw, mmap.mmap):
+                raw.close()
+
+    except _PARSE_ERRORS:
+        print(f"  - Warning: Could not parse JSON from {filepath}. File might be empty or corrupt.")
+    except Exception as e:
+        print(f"  - An unexpected error occurred with {filepath}: {e}")
+
+    return japanese_lines
+
+
+def extract_from_files(filepaths, read_order=None):
+    """
+    Runs extract_japanese_lines over many files in parallel and returns a
+    dict mapping each path to its list of Japanese lines.
+
+    Files are read in read_order if the caller already knows a good one
+    (e.g. from scandir inodes), otherwise they are stat'ed and read in
+    inode order, which tends to follow the on-disk layout and keeps the
+    kernel's readahead close to sequential. The returned dict lets callers
+    assemble output in whatever order they need, so results are identical
+    to a sequential run.
+    """
+    if read_order is None:
+        read_order = sorted(filepaths, key=_inode)
+
+    lines_by_file = {}
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        results = executor.map(extract_japanese_lines, read_order, chunksize=16)
+        for filepath, japanese_lines in zip(read_order, results):
+            print(f"Processing {filepath}...")
+            lines_by_file[filepath] = japanese_lines
+
+    return lines_by_file
@@ -1,8 +1,8 @@
 # Processes all json files in the directory to produce one or more text files with all the Japanese text.
-import json
-import re
+import itertools
 import os
-import collections
+
+import mokuro_core
 
 # --- Configuration ---
 
@@ -17,42 +17,43 @@ CREATE_FILE_PER_VOLUME = True
 # This file will be created in the directory where you run the script.
 OUTPUT_FILENAME = "combined_japanese_text.txt"
 
+# SET THIS FLAG to drop repeated lines (sound effects, page markers, ...)
+# so each output file contains each distinct line once, keeping the first
+# occurrence in place. Dedup is scoped to one output file: per volume when
+# CREATE_FILE_PER_VOLUME is True, across everything otherwise. Leave False
+# to preserve the full text stream.
+DEDUPLICATE_LINES = False
 
-# --- Main Script ---
 
-def contains_japanese(text):
-    """
-    Checks if a string contains any Japanese characters
-    (Hiragana, Katakana, or Kanji).
-    """
-    # Unicode ranges for Japanese characters:
-    # \u3040-\u309F: Hiragana
-    # \u30A0-\u30FF: Katakana
-    # \u4E00-\u9FFF: CJK Unified Ideographs (Kanji)
-    return re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', text)
+# --- Main Script ---
 
 def process_files():
     """
     Main function to find all .json files in the current directory and all subdirectories,
     extract text, and write to an output file (or files).
     """
-    # Use a dictionary to store lines per volume. This allows us to group text
-    # by its source directory. e.g., {'Volume 01': ['line 1', 'line 2'], 'Volume 02': ['line 3']}
-    volume_data = collections.defaultdict(list)
-
-    # Find all .json files by walking through the directory tree.
-    json_filepaths = []
+    # Find all .json files by walking through the directory tree. The
+    # volume name is derived from the containing directory, so compute it
+    # once per directory here instead of re-parsing every file path later:
+    # the normpath/basename string work becomes O(directories), not O(files).
+    json_files = []
     print("Finding all .json files in the current directory and subdirectories...")
     for dirpath, _, filenames in os.walk('.'):
+        # e.g., './Volume 01' -> 'Volume 01'; the walk root itself
+        # normalizes to '.', so files there get a default volume name.
+        volume_name = os.path.basename(os.path.normpath(dirpath))
+        if not volume_name or volume_name == '.':
+            volume_name = "root_volume"
         for filename in filenames:
-            if filename.endswith('.json'):
-                # Construct the full path (e.g., 'Volume 01/00001.json') and add it to our list.
-                full_path = os.path.join(dirpath, filename)
-                json_filepaths.append(full_path)
+            # We should not process our own output file if it happens to be a JSON file.
+            if filename.endswith('.json') and filename != OUTPUT_FILENAME:
+                # Store the volume alongside the full path (e.g., 'Volume 01/00001.json').
+                json_files.append((volume_name, os.path.join(dirpath, filename)))
 
     try:
-        # Sort the list to process files in a predictable order (e.g., Volume 01, Volume 02...)
-        json_filepaths.sort()
+        # Sort by path to process files in a predictable order (e.g., Volume 01, Volume 02...)
+        json_files.sort(key=lambda pair: pair[1])
+        json_filepaths = [filepath for _, filepath in json_files]
 
         if not json_filepaths:
             print("No .json files were found in this directory or its subdirectories. Exiting.")
@@ -64,39 +65,25 @@ def process_files():
         print(f"Error: An unexpected error occurred during file search. {e}")
         return
 
-    # Loop through the list of discovered JSON filepaths
-    for filepath in json_filepaths:
-        # We should not process our own output file if it happens to be a JSON file.
-        if os.path.basename(filepath) == OUTPUT_FILENAME:
-            continue
-
-        print(f"Processing {filepath}...")
-        try:
-            # Determine the volume name from the file's parent directory.
-            # e.g., os.path.dirname('Volume 01/00001.json') -> 'Volume 01'
-            # We use normpath to clean up paths like './Volume 01'
-            volume_name = os.path.basename(os.path.normpath(os.path.dirname(filepath)))
-            # If a file is in the root directory, its dirname is empty or '.', so give it a default name.
-            if not volume_name or volume_name == '.':
-                volume_name = "root_volume"
-
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-                # The text is in data['blocks'][...]['lines']
-                if 'blocks' in data and data['blocks']:
-                    for block in data['blocks']:
-                        if 'lines' in block and block['lines']:
-                            for line in block['lines']:
-                                # Add the line only if it contains Japanese text
-                                if contains_japanese(line):
-                                    # Append the line to the correct volume's list
-                                    volume_data[volume_name].append(line)
-
-        except json.JSONDecodeError:
-            print(f"  - Warning: Could not parse JSON from {filepath}. File might be empty or corrupt.")
-        except Exception as e:
-            print(f"  - An unexpected error occurred with {filepath}: {e}")
+    lines_by_file = mokuro_core.extract_from_files(json_filepaths)
+
+    # Group the files by volume first, then build each volume's line list
+    # in a single chain.from_iterable pass. Each list is allocated once
+    # from the per-file results instead of growing through repeated
+    # appends, and the text stays grouped by its source directory.
+    # e.g., {'Volume 01': ['line 1', 'line 2'], 'Volume 02': ['line 3']}
+    volume_files = {}
+    for volume_name, filepath in json_files:
+        volume_files.setdefault(volume_name, []).append(filepath)
+
+    volume_data = {}
+    for volume_name, filepaths in volume_files.items():
+        lines = list(itertools.chain.from_iterable(
+            lines_by_file[filepath] for filepath in filepaths))
+        # Skip volumes with no Japanese text so they don't produce empty
+        # output files.
+        if lines:
+            volume_data[volume_name] = lines
 
     if not volume_data:
         print("\n---")
@@ -110,12 +97,18 @@ def process_files():
         print("Writing output to a separate file for each volume...")
         total_lines_processed = 0
         for volume_name, lines in sorted(volume_data.items()):
+            if DEDUPLICATE_LINES:
+                # dict.fromkeys dedups in C while preserving first-seen order.
+                lines = list(dict.fromkeys(lines))
             # Create a filename from the volume name and add the .txt extension
             volume_filename = f"{volume_name}.txt"
             try:
-                with open(volume_filename, 'w', encoding='utf-8') as f:
-                    for line in lines:
-                        f.write(line + '\n')
+                # Lines arrive UTF-8-encoded and newline-terminated from
+                # the workers, so a binary-mode writelines pushes them out
+                # in C with no encoding layer or per-line string work; the
+                # 1 MB buffer lets the OS coalesce flushes.
+                with open(volume_filename, 'wb', buffering=1 << 20) as f:
+                    f.writelines(lines)
                 print(f"  - Successfully created '{volume_filename}' with {len(lines)} lines.")
                 total_lines_processed += len(lines)
             except Exception as e:
@@ -132,10 +125,17 @@ def process_files():
         for volume_name in sorted(volume_data.keys()):
             all_japanese_lines.extend(volume_data[volume_name])
 
+        if DEDUPLICATE_LINES:
+            # dict.fromkeys dedups in C while preserving first-seen order.
+            all_japanese_lines = list(dict.fromkeys(all_japanese_lines))
+
         try:
-            with open(OUTPUT_FILENAME, 'w', encoding='utf-8') as f:
-                for line in all_japanese_lines:
-                    f.write(line + '\n')
+            # Lines arrive UTF-8-encoded and newline-terminated from the
+            # workers, so a binary-mode writelines pushes them out in C
+            # with no encoding layer or per-line string work; the 1 MB
+            # buffer lets the OS coalesce flushes.
+            with open(OUTPUT_FILENAME, 'wb', buffering=1 << 20) as f:
+                f.writelines(all_japanese_lines)
 
             print(f"\nSuccess! All Japanese text has been combined into '{OUTPUT_FILENAME}'.")
             print(f"Total lines extracted: {len(all_japanese_lines)}")